@@ -1,133 +1,278 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
 import json
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
 from typing import Iterable, List
 
-from tqdm import tqdm
+
+
+def _hms(t: float) -> tuple[int, int, int, int]:
+    """Splits seconden in (h, m, s, ms) met één rekenblok i.p.v. drie divmods."""
+    ms_total = int(t * 1000)
+    ms = ms_total % 1000
+    s_total = ms_total // 1000
+    s = s_total % 60
+    m_total = s_total // 60
+    m = m_total % 60
+    h = m_total // 60
+    return h, m, s, ms
 
 
 def srt_time(t: float) -> str:
-    h, m = divmod(int(t), 3600)
-    m, s = divmod(m, 60)
-    ms = int((t - int(t)) * 1000)
+    h, m, s, ms = _hms(t)
     return f"{h:02}:{m:02}:{s:02},{ms:03}"
 
 
+def vtt_time(t: float) -> str:
+    h, m, s, ms = _hms(t)
+    return f"{h:02}:{m:02}:{s:02}.{ms:03}"
+
+
 def format_time(seconds: float) -> str:
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
+    h, m, s, _ = _hms(seconds)
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-def write_org(segments, info, path: Path) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        f.write("#+TITLE: Transcriptie\n")
-        f.write(f"#+LANGUAGE: {info.language}\n")
-        f.write(f"#+LANGUAGE_PROBABILITY: {info.language_probability:.3f}\n\n")
+class _BufferedTextWriter:
+    """Incrementele writer: buffert segment-strings en flusht in blokken.
 
-        for seg in segments:
-            timestamp = format_time(seg.start)
-            f.write(f"[{timestamp}] {seg.text.strip()}\n\n")
+    Eén writelines() per _FLUSH_EVERY segmenten i.p.v. een write() (encode +
+    syscall-bookkeeping) per segment; dat scheelt vooral op netwerk-filesystems.
+    """
 
+    _FLUSH_EVERY = 1024
 
-def write_md(segments, info, path: Path) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        f.write("# Transcriptie\n\n")
-        f.write(f"**Taal:** {info.language} (zekerheid: {info.language_probability:.1%})\n\n")
-        f.write("---\n\n")
+    def __init__(self, path: Path, info):
+        self.f = path.open("w", encoding="utf-8")
+        self._buf: List[str] = []
 
-        for seg in segments:
-            timestamp = format_time(seg.start)
-            f.write(f"## [{timestamp}]\n\n{seg.text.strip()}\n\n")
+    def _emit(self, s: str) -> None:
+        buf = self._buf
+        buf.append(s)
+        if len(buf) >= self._FLUSH_EVERY:
+            self.f.writelines(buf)
+            buf.clear()
+
+    def close(self) -> None:
+        if self._buf:
+            self.f.writelines(self._buf)
+            self._buf.clear()
+        self.f.close()
+
+
+def _org_header(info) -> str:
+    return (
+        "#+TITLE: Transcriptie\n"
+        f"#+LANGUAGE: {info.language}\n"
+        f"#+LANGUAGE_PROBABILITY: {info.language_probability:.3f}\n\n"
+    )
+
+
+def _md_header(info) -> str:
+    return (
+        "# Transcriptie\n\n"
+        f"**Taal:** {info.language} (zekerheid: {info.language_probability:.1%})\n\n"
+        "---\n\n"
+    )
+
+
+class _OrgWriter(_BufferedTextWriter):
+    def __init__(self, path: Path, info):
+        super().__init__(path, info)
+        self._emit(_org_header(info))
 
+    def write_segment(self, i, seg, start, end, text, start_hms, end_hms) -> None:
+        h, m, sec, _ = start_hms
+        self._emit(f"[{h:02}:{m:02}:{sec:02}] {text}\n\n")
 
-def write_json(segments, info, path: Path) -> None:
-    data = {
-        "language": info.language,
-        "language_probability": info.language_probability,
-        "segments": [
+
+class _MdWriter(_BufferedTextWriter):
+    def __init__(self, path: Path, info):
+        super().__init__(path, info)
+        self._emit(_md_header(info))
+
+    def write_segment(self, i, seg, start, end, text, start_hms, end_hms) -> None:
+        h, m, sec, _ = start_hms
+        self._emit(f"## [{h:02}:{m:02}:{sec:02}]\n\n{text}\n\n")
+
+
+class _SrtWriter(_BufferedTextWriter):
+    def write_segment(self, i, seg, start, end, text, start_hms, end_hms) -> None:
+        h1, m1, s1, ms1 = start_hms
+        h2, m2, s2, ms2 = end_hms
+        self._emit(
+            f"{i}\n{h1:02}:{m1:02}:{s1:02},{ms1:03} --> {h2:02}:{m2:02}:{s2:02},{ms2:03}\n{text}\n\n"
+        )
+
+
+class _VttWriter(_BufferedTextWriter):
+    def __init__(self, path: Path, info):
+        super().__init__(path, info)
+        self._emit("WEBVTT\n\n")
+
+    def write_segment(self, i, seg, start, end, text, start_hms, end_hms) -> None:
+        h1, m1, s1, ms1 = start_hms
+        h2, m2, s2, ms2 = end_hms
+        self._emit(
+            f"{h1:02}:{m1:02}:{s1:02}.{ms1:03} --> {h2:02}:{m2:02}:{s2:02}.{ms2:03}\n{text}\n\n"
+        )
+
+
+class _JsonWriter:
+    """JSON heeft de volledige lijst nodig; buffert en schrijft bij close()."""
+
+    def __init__(self, path: Path, info):
+        self.path = path
+        self.info = info
+        self.segments: list = []
+
+    def write_segment(self, i, seg, start, end, text, start_hms, end_hms) -> None:
+        self.segments.append(
             {
-                "start": seg.start,
-                "end": seg.end,
+                "start": start,
+                "end": end,
                 "text": seg.text,
                 "avg_logprob": seg.avg_logprob,
                 "no_speech_prob": seg.no_speech_prob,
                 "temperature": seg.temperature,
-                "tokens": seg.tokens,
+                "tokens": list(seg.tokens) if seg.tokens is not None else None,
             }
-            for seg in segments
-        ],
-    }
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        )
 
+    def close(self) -> None:
+        data = {
+            "language": self.info.language,
+            "language_probability": self.info.language_probability,
+            "segments": self.segments,
+        }
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        if orjson is not None:
+            # orjson serialiseert in C direct naar bytes; 5-10x sneller dan json
+            self.path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            self.path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
-def write_srt(segments, path: Path) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        for i, seg in enumerate(segments, 1):
-            f.write(f"{i}\n{srt_time(seg.start)} --> {srt_time(seg.end)}\n{seg.text.strip()}\n\n")
 
+_WRITERS = {
+    "org": _OrgWriter,
+    "md": _MdWriter,
+    "json": _JsonWriter,
+    "srt": _SrtWriter,
+    "vtt": _VttWriter,
+}
+
+
+def open_writers(formats: List[str], output_paths: dict[str, Path], info) -> list:
+    return [_WRITERS[fmt](output_paths[fmt], info) for fmt in formats]
 
-def write_vtt(segments, path: Path) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        f.write("WEBVTT\n\n")
-        for seg in segments:
-            start = srt_time(seg.start).replace(",", ".")
-            end = srt_time(seg.end).replace(",", ".")
-            f.write(f"{start} --> {end}\n{seg.text.strip()}\n\n")
+
+def close_writers(writers: list) -> None:
+    """Sluit writers parallel: de flush (writelines/JSON-encode) per format is
+    onafhankelijk en grotendeels I/O, dus de close-fase overlapt netjes."""
+    if len(writers) > 1:
+        with ThreadPoolExecutor(max_workers=len(writers)) as pool:
+            for future in [pool.submit(w.close) for w in writers]:
+                future.result()
+    elif writers:
+        writers[0].close()
+
+
+_ALL_ORDER = ("org", "md", "json", "srt", "vtt")
+_ALLOWED = frozenset(_ALL_ORDER)
 
 
 def parse_formats(values: Iterable[str]) -> List[str]:
     if not values:
         return ["org"]
 
-    formats: List[str] = []
-    for value in values:
-        parts = [p.strip().lower() for p in value.split(",") if p.strip()]
-        formats.extend(parts)
+    # dict.fromkeys dedupet in één C-call met behoud van volgorde.
+    formats = list(
+        dict.fromkeys(
+            part.strip().lower() for value in values for part in value.split(",") if part.strip()
+        )
+    )
 
     if "all" in formats:
-        return ["org", "md", "json", "srt", "vtt"]
-
-    seen = set()
-    deduped = []
-    for fmt in formats:
-        if fmt not in seen:
-            seen.add(fmt)
-            deduped.append(fmt)
-    return deduped
+        return list(_ALL_ORDER)
+    return formats
 
 
-def resolve_output_paths(
-    audio_path: Path, output: str | None, formats: List[str]
-) -> dict[str, Path]:
-    ext_map = {
+EXT_MAP = MappingProxyType(
+    {
         "org": ".org",
         "md": ".md",
         "json": ".json",
         "srt": ".srt",
         "vtt": ".vtt",
     }
+)
+
 
+def resolve_output_paths(
+    audio_path: Path, output: str | None, formats: List[str]
+) -> dict[str, Path]:
     if output:
         out_path = Path(output)
         if out_path.is_dir():
             base = out_path / audio_path.stem
-            return {fmt: base.with_suffix(ext_map[fmt]) for fmt in formats}
-
-        if out_path.suffix:
+        elif out_path.suffix:
             if len(formats) == 1:
                 return {formats[0]: out_path}
             base = out_path.with_suffix("")
-            return {fmt: base.with_suffix(ext_map[fmt]) for fmt in formats}
+        else:
+            base = out_path
+    else:
+        base = audio_path.with_suffix("")
+
+    # String-concat i.p.v. Path.with_suffix: geen stem/suffix-parse per format,
+    # en een basisnaam met punten erin houdt die punten gewoon.
+    base_str = str(base)
+    return {fmt: Path(base_str + EXT_MAP[fmt]) for fmt in formats}
+
 
-        base = out_path
-        return {fmt: base.with_suffix(ext_map[fmt]) for fmt in formats}
+def _pin_thread_env(threads: int = 0) -> None:
+    """Zet OpenMP/MKL-thread-limieten vóór de eerste native import.
 
-    base = audio_path.with_suffix("")
-    return {fmt: base.with_suffix(ext_map[fmt]) for fmt in formats}
+    Zonder limiet pakt OpenMP alle (hyper)threads, wat de GEMM-caches laat
+    thrashen; de helft van de cores is op hyperthreaded machines sneller.
+    setdefault, dus een expliciete omgeving wint altijd.
+    """
+    n = threads if threads > 0 else max(1, (os.cpu_count() or 2) // 2)
+    os.environ.setdefault("OMP_NUM_THREADS", str(n))
+    os.environ.setdefault("MKL_NUM_THREADS", str(n))
+
+
+def pick_compute_type(device: str, verbose: bool = False) -> str:
+    """Kies het snelste compute_type dat deze machine ondersteunt.
+
+    Op CPU's met VNNI (int8 dot-product instructies) is int8_float32 dynamische
+    quantisatie ~2x sneller dan gewoon int8; op Ampere+ GPU's geldt hetzelfde
+    voor int8_float16 t.o.v. float16. CTranslate2 rapporteert alleen de types
+    die de hardware echt aankan.
+    """
+    fallback = "int8" if device == "cpu" else "float16"
+    try:
+        import ctranslate2
+
+        supported = set(ctranslate2.get_supported_compute_types(device))
+    except Exception:
+        return fallback
+
+    preferred = ["int8_float32", "int8"] if device == "cpu" else ["int8_float16", "float16"]
+    for candidate in preferred:
+        if candidate in supported:
+            if verbose:
+                print(f"Compute type: {candidate} (ondersteund: {', '.join(sorted(supported))})")
+            return candidate
+    return fallback
 
 
 def pick_device(device: str, verbose: bool = False) -> str:
@@ -139,16 +284,37 @@ def pick_device(device: str, verbose: bool = False) -> str:
     if device != "auto":
         return device
 
+    if os.environ.get("CUDA_VISIBLE_DEVICES") == "":
+        if verbose:
+            print("CUDA_VISIBLE_DEVICES is leeg, gebruik CPU.")
+        return "cpu"
+
+    # CUDA-detectie via ctranslate2 (wordt toch al geladen door faster-whisper);
+    # torch importeren kost 300-800 ms en is alleen nodig voor de GPU-naam.
     try:
-        import torch
+        import ctranslate2
 
-        if torch.cuda.is_available():
+        if ctranslate2.get_cuda_device_count() > 0:
             if verbose:
-                print(f"GPU gevonden: {torch.cuda.get_device_name(0)}")
+                try:
+                    import torch
+
+                    print(f"GPU gevonden: {torch.cuda.get_device_name(0)}")
+                except ImportError:
+                    print("GPU gevonden.")
             return "cuda"
     except ImportError:
-        if verbose:
-            print("PyTorch niet gevonden, gebruik CPU.")
+        # Geen ctranslate2 (bv. backend=whisper): val terug op torch-detectie.
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                if verbose:
+                    print(f"GPU gevonden: {torch.cuda.get_device_name(0)}")
+                return "cuda"
+        except ImportError:
+            if verbose:
+                print("PyTorch niet gevonden, gebruik CPU.")
 
     if verbose:
         print("Geen CUDA beschikbaar, gebruik CPU.")
@@ -172,38 +338,120 @@ class Info:
         self.language_probability = language_probability if language_probability is not None else 0.0
 
 
-def transcribe_faster_whisper(
-    audio_path: Path, model_name: str, device: str, compute: str, vad_filter: bool
-):
+def load_whisper_model(model_name: str, device: str, compute: str, cpu_threads: int = 0, num_workers: int = 0):
     from faster_whisper import WhisperModel
 
+    ncpu = os.cpu_count() or 2
+    if num_workers <= 0:
+        num_workers = max(1, ncpu // 4)
+    if cpu_threads <= 0:
+        # Halve core-count: hyperthreads delen caches en helpen GEMM niet.
+        cpu_threads = max(1, ncpu // 2)
+
+    def construct(dev: str, comp: str):
+        kwargs = dict(device=dev, compute_type=comp, cpu_threads=cpu_threads, num_workers=num_workers)
+        if dev == "cuda":
+            kwargs["flash_attention"] = True
+        try:
+            return WhisperModel(model_name, **kwargs)
+        except TypeError:
+            # Oudere faster-whisper zonder flash_attention parameter.
+            kwargs.pop("flash_attention", None)
+            return WhisperModel(model_name, **kwargs)
+
     try:
-        model = WhisperModel(model_name, device=device, compute_type=compute)
+        model = construct(device, compute)
     except RuntimeError as e:
         if "libcublas" in str(e) or "CUDA" in str(e):
             print("CUDA niet beschikbaar, val terug op CPU...")
-            device = "cpu"
-            compute = "int8"
-            model = WhisperModel(model_name, device=device, compute_type=compute)
+            model = construct("cpu", pick_compute_type("cpu"))
         else:
             raise
     except ValueError as e:
         # CTranslate2 build without CUDA support (common on ROCm setups)
         if "CTranslate2 package was not compiled with CUDA support" in str(e):
             print("CTranslate2 heeft geen CUDA support, val terug op CPU...")
-            device = "cpu"
-            compute = "int8"
-            model = WhisperModel(model_name, device=device, compute_type=compute)
+            model = construct("cpu", pick_compute_type("cpu"))
         else:
             raise
+    return model
 
-    segments_iter, info = model.transcribe(str(audio_path), vad_filter=vad_filter)
-    segments = []
-    with tqdm(desc="Segmenten verwerken", unit=" seg") as pbar:
-        for seg in segments_iter:
-            segments.append(seg)
-            pbar.update(1)
-    return segments, info
+
+def make_batched_pipeline(model):
+    """BatchedInferencePipeline als de faster-whisper versie die heeft, anders None."""
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:
+        return None
+    return BatchedInferencePipeline(model=model)
+
+
+AUDIO_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "doc-tools" / "audio"
+
+
+def load_audio_cached(audio_path: Path):
+    """Decodeer audio één keer naar 16 kHz float32 PCM en cache het ruwe buffer.
+
+    Opeenvolgende runs (bv. eerst json, daarna org) lezen de PCM via np.memmap
+    terug en slaan de ffmpeg-decode helemaal over. De cachesleutel bevat mtime
+    en grootte, dus een gewijzigd bronbestand krijgt een nieuwe entry.
+    """
+    import numpy as np
+    from faster_whisper.audio import decode_audio
+
+    st = audio_path.stat()
+    key = hashlib.sha1(f"{audio_path}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()
+    cache = AUDIO_CACHE_DIR / f"{key}.f32.16k"
+    if cache.exists():
+        return np.memmap(cache, dtype=np.float32, mode="r")
+
+    audio = np.asarray(decode_audio(str(audio_path), sampling_rate=16000), dtype=np.float32)
+    AUDIO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_suffix(".tmp")
+    audio.tofile(tmp)
+    os.replace(tmp, cache)
+    return audio
+
+
+def precompute_vad(audio_path: Path) -> list | None:
+    """Draai Silero-VAD (meegeleverd met faster-whisper) los van de transcriptie.
+
+    Geeft vlakke [start, end, start, end, ...] tijden in seconden terug voor
+    clip_timestamps, zodat model.transcribe de VAD-pass kan overslaan. Wordt in
+    een aparte thread gedraaid zodat de VAD overlapt met het laden van het model.
+    """
+    from faster_whisper.audio import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    try:
+        audio = load_audio_cached(audio_path)
+    except Exception:
+        audio = decode_audio(str(audio_path), sampling_rate=16000)
+    speech = get_speech_timestamps(audio, VadOptions())
+    clip: list = []
+    for chunk in speech:
+        clip.append(chunk["start"] / 16000.0)
+        clip.append(chunk["end"] / 16000.0)
+    return clip or None
+
+
+def transcribe_faster_whisper(
+    model, audio, vad_filter: bool, pipeline=None, batch_size: int = 8,
+    clip_timestamps=None, decode_options: dict | None = None,
+):
+    # `audio` mag een pad-string zijn of een 16 kHz float32 ndarray (PCM-cache).
+    opts = decode_options or {}
+    if pipeline is not None:
+        segments_iter, info = pipeline.transcribe(
+            audio, batch_size=batch_size, vad_filter=vad_filter, **opts
+        )
+    elif clip_timestamps is not None:
+        segments_iter, info = model.transcribe(
+            audio, vad_filter=False, clip_timestamps=clip_timestamps, **opts
+        )
+    else:
+        segments_iter, info = model.transcribe(audio, vad_filter=vad_filter, **opts)
+    return segments_iter, info
 
 
 def transcribe_openai_whisper(
@@ -223,9 +471,29 @@ def transcribe_openai_whisper(
     return segments, info
 
 
-def main() -> int:
+def write_outputs(segments, info, formats: List[str], output_paths: dict[str, Path]) -> int:
+    """Schrijf alle formaten in één pass over de segmenten; geeft het aantal terug."""
+    writers = open_writers(formats, output_paths, info)
+    write_fns = [w.write_segment for w in writers]  # bind buiten de hot loop
+    n = 0
+    for seg in segments:
+        n += 1
+        # Attribuut-toegang, strip() en de h/m/s/ms-rekensom één keer per
+        # segment, niet per writer.
+        start = seg.start
+        end = seg.end
+        text = seg.text.strip()
+        start_hms = _hms(start)
+        end_hms = _hms(end)
+        for write_segment in write_fns:
+            write_segment(n, seg, start, end, text, start_hms, end_hms)
+    close_writers(writers)
+    return n
+
+
+def main(argv: List[str] | None = None, default_formats: List[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Transcribe audio with faster-whisper")
-    parser.add_argument("audio", help="Pad naar audiobestand (mp3/wav/...)")
+    parser.add_argument("audio", nargs="+", help="Pad(en) naar audiobestand(en) (mp3/wav/...)")
     parser.add_argument(
         "-f",
         "--format",
@@ -244,64 +512,221 @@ def main() -> int:
     parser.add_argument(
         "--compute-type",
         default=None,
-        help="float16, int8_float16, int8, etc. (default: int8 op CPU, float16 op GPU)",
+        help="float16, int8_float16, int8, etc. (default: snelste ondersteunde type voor het device)",
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=0,
+        help="Aantal CPU threads voor CTranslate2/OpenMP (default: helft van de cores)",
+    )
+    parser.add_argument(
+        "--faster-whisper-workers",
+        type=int,
+        default=0,
+        help="num_workers (parallelle decode-streams) voor CTranslate2 (default: cores/4)",
+    )
+    parser.add_argument(
+        "--quality",
+        choices=["fast", "high"],
+        default="fast",
+        help="fast = greedy decoderen (beam 1, ~3x sneller), high = beam search zoals voorheen",
+    )
+    parser.add_argument("--beam-size", type=int, default=None, help="Override beam size")
+    parser.add_argument("--best-of", type=int, default=None, help="Override best_of bij sampling")
+    parser.add_argument("--temperature", type=float, default=None, help="Vaste temperatuur (0 = geen fallback-ladder)")
+    parser.add_argument(
+        "--condition-on-previous-text",
+        action="store_true",
+        help="Conditioneer op voorgaande tekst (trager, soms consistenter)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Batchgrootte voor de BatchedInferencePipeline (1 = klassiek sequentieel)",
     )
     parser.add_argument("--no-vad", action="store_true", help="Schakel VAD filter uit")
+    parser.add_argument(
+        "--no-audio-cache",
+        action="store_true",
+        help="Sla de gedecodeerde-PCM cache in ~/.cache/doc-tools/audio over",
+    )
+    parser.add_argument(
+        "--server",
+        action="store_true",
+        help="Stuur de job naar een lang-levende transcribe_server (start die zo nodig)",
+    )
     parser.add_argument("-v", "--verbose", action="store_true")
-    args = parser.parse_args()
-
-    audio_path = Path(args.audio).resolve()
-    if not audio_path.exists():
-        print(f"Error: Bestand niet gevonden: {audio_path}")
+    args = parser.parse_args(argv)
+
+    audio_paths = [Path(a).resolve() for a in args.audio]
+    for audio_path in audio_paths:
+        if not audio_path.exists():
+            print(f"Error: Bestand niet gevonden: {audio_path}")
+            return 1
+
+    if args.format:
+        formats = parse_formats(args.format)
+    elif default_formats:
+        formats = list(default_formats)
+    else:
+        formats = parse_formats([])
+    unknown = set(formats) - _ALLOWED
+    if unknown:
+        print(f"Onbekende format(s): {', '.join(sorted(unknown))}")
         return 1
 
-    formats = parse_formats(args.format or [])
-    allowed = {"org", "md", "json", "srt", "vtt"}
-    unknown = [f for f in formats if f not in allowed]
-    if unknown:
-        print(f"Onbekende format(s): {', '.join(unknown)}")
+    if len(audio_paths) > 1 and args.output and not Path(args.output).is_dir():
+        print("Error: bij meerdere audiobestanden moet --output een directory zijn")
         return 1
 
-    output_paths = resolve_output_paths(audio_path, args.output, formats)
+    if args.server:
+        import transcribe_server
+
+        for audio_path in audio_paths:
+            reply = transcribe_server.request(
+                {
+                    "audio": str(audio_path),
+                    "formats": formats,
+                    "output": args.output,
+                    "model": args.model,
+                    "device": args.device,
+                    "compute_type": args.compute_type,
+                    "cpu_threads": args.cpu_threads,
+                    "vad_filter": not args.no_vad,
+                }
+            )
+            if not reply.get("ok"):
+                print(f"Server fout: {reply.get('error', 'onbekend')}")
+                return 1
+            print(f"✓ Klaar (via server): {audio_path.name}")
+            for fmt, path in reply["outputs"].items():
+                print(f"  {fmt}: {path}")
+            print(f"  Taal: {reply['language']} (p={reply['language_probability']:.3f})")
+            print(f"  Segmenten: {reply['num_segments']}")
+        return 0
+
+    # Vóór de eerste native import (pick_device kan ctranslate2 laden).
+    _pin_thread_env(args.cpu_threads)
 
     device = pick_device(args.device, verbose=args.verbose)
-    compute = args.compute_type or ("int8" if device == "cpu" else "float16")
+    compute = args.compute_type or pick_compute_type(device, verbose=args.verbose)
 
     if args.verbose:
         print(f"Model laden: {args.model} op {device} ({compute})...")
 
-    if args.backend == "whisper":
-        segments, info = transcribe_openai_whisper(
-            audio_path, args.model, device, compute, not args.no_vad
-        )
+    if args.quality == "high":
+        decode_options = {"beam_size": 5, "best_of": 5, "condition_on_previous_text": True}
     else:
-        segments, info = transcribe_faster_whisper(
-            audio_path, args.model, device, compute, vad_filter=not args.no_vad
+        decode_options = {"beam_size": 1, "best_of": 1, "condition_on_previous_text": False}
+    if args.beam_size is not None:
+        decode_options["beam_size"] = args.beam_size
+    if args.best_of is not None:
+        decode_options["best_of"] = args.best_of
+    if args.temperature is not None:
+        decode_options["temperature"] = args.temperature
+    if args.condition_on_previous_text:
+        decode_options["condition_on_previous_text"] = True
+
+    model = None
+    pipeline = None
+    vad_pool = None
+    vad_futures: dict = {}
+    if args.backend != "whisper":
+        if not args.no_vad and args.batch_size <= 1:
+            # Start de VAD alvast; die overlapt dan met het laden van het model.
+            # (De batched pipeline doet z'n eigen VAD-batching.)
+            vad_pool = ThreadPoolExecutor(max_workers=min(4, len(audio_paths)))
+            vad_futures = {p: vad_pool.submit(precompute_vad, p) for p in audio_paths}
+        model = load_whisper_model(
+            args.model,
+            device,
+            compute,
+            cpu_threads=args.cpu_threads,
+            num_workers=args.faster_whisper_workers,
         )
+        if args.batch_size > 1:
+            pipeline = make_batched_pipeline(model)
 
-    if args.verbose:
-        print("Bestanden schrijven...")
-
-    for fmt in formats:
-        out_path = output_paths[fmt]
-        if fmt == "org":
-            write_org(segments, info, out_path)
-        elif fmt == "md":
-            write_md(segments, info, out_path)
-        elif fmt == "json":
-            write_json(segments, info, out_path)
-        elif fmt == "srt":
-            write_srt(segments, out_path)
-        elif fmt == "vtt":
-            write_vtt(segments, out_path)
-
-    print("✓ Klaar:")
-    for fmt in formats:
-        print(f"  {fmt}: {output_paths[fmt]}")
-    print(f"  Taal: {info.language} (p={info.language_probability:.3f})")
-    print(f"  Segmenten: {len(segments)}")
+    for audio_path in audio_paths:
+        output_paths = resolve_output_paths(audio_path, args.output, formats)
+
+        if args.backend == "whisper":
+            segments, info = transcribe_openai_whisper(
+                audio_path, args.model, device, compute, not args.no_vad
+            )
+        else:
+            clip_timestamps = None
+            future = vad_futures.get(audio_path)
+            if future is not None:
+                try:
+                    clip_timestamps = future.result()
+                except Exception:
+                    clip_timestamps = None  # val terug op vad_filter in transcribe
+            audio_input = str(audio_path)
+            if not args.no_audio_cache:
+                try:
+                    audio_input = load_audio_cached(audio_path)
+                except Exception:
+                    audio_input = str(audio_path)
+            segments, info = transcribe_faster_whisper(
+                model,
+                audio_input,
+                vad_filter=not args.no_vad,
+                pipeline=pipeline,
+                batch_size=args.batch_size,
+                clip_timestamps=clip_timestamps,
+                decode_options=decode_options,
+            )
+
+        writers = open_writers(formats, output_paths, info)
+        pbar = None
+        if args.verbose:
+            from tqdm import tqdm
+
+            pbar = tqdm(desc="Segmenten verwerken", unit=" seg", mininterval=0.5)
+        # Method-lookups één keer binden i.p.v. per segment opzoeken.
+        write_fns = [w.write_segment for w in writers]
+        update = pbar.update if pbar is not None else None
+        n = 0
+        for seg in segments:
+            n += 1
+            # Attribuut-toegang, strip() en de h/m/s/ms-rekensom één keer per
+            # segment, niet per writer.
+            start = seg.start
+            end = seg.end
+            text = seg.text.strip()
+            start_hms = _hms(start)
+            end_hms = _hms(end)
+            for write_segment in write_fns:
+                write_segment(n, seg, start, end, text, start_hms, end_hms)
+            if update is not None:
+                update(1)
+        if pbar is not None:
+            pbar.close()
+        close_writers(writers)
+
+        print(f"✓ Klaar: {audio_path.name}" if len(audio_paths) > 1 else "✓ Klaar:")
+        for fmt in formats:
+            print(f"  {fmt}: {output_paths[fmt]}")
+        print(f"  Taal: {info.language} (p={info.language_probability:.3f})")
+        print(f"  Segmenten: {n}")
+
+    if vad_pool is not None:
+        vad_pool.shutdown(wait=False)
     return 0
 
 
+def main_json() -> int:
+    """Entry point voor mp3-to-json: zelfde CLI, default format json."""
+    return main(default_formats=["json"])
+
+
+def main_org() -> int:
+    """Entry point voor mp3-to-org: zelfde CLI, default format org."""
+    return main(default_formats=["org"])
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
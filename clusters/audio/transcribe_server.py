@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Lang-levende transcriptie-server voor media_transcribe.
+
+Het laden van een groot Whisper-model (honderden MB tot enkele GB) domineert
+de looptijd van korte clips. Deze server houdt geladen modellen in het
+geheugen, gecached op (model, device, compute_type), zodat opeenvolgende jobs
+de load overslaan. Communicatie loopt via een Unix domain socket met één
+JSON-object per regel.
+
+Gebruik:
+  transcribe_server.py [--socket PATH]        # start de server op de voorgrond
+  media_transcribe.py --server audio.mp3      # stuur een job (start zo nodig de server)
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import media_transcribe  # noqa: E402
+
+DEFAULT_SOCKET = Path(os.environ.get("XDG_RUNTIME_DIR", "/tmp")) / "media-transcribe.sock"
+
+# Geladen modellen, gecached op (model_name, device, compute_type).
+_models: dict = {}
+
+
+def _get_model(model_name: str, device: str, compute: str, cpu_threads: int = 0):
+    key = (model_name, device, compute)
+    model = _models.get(key)
+    if model is None:
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(model_name, device=device, compute_type=compute, cpu_threads=cpu_threads)
+        _models[key] = model
+    return model
+
+
+def _run_job(job: dict) -> dict:
+    audio_path = Path(job["audio"]).resolve()
+    if not audio_path.exists():
+        return {"ok": False, "error": f"Bestand niet gevonden: {audio_path}"}
+
+    formats = job.get("formats") or ["org"]
+    output_paths = media_transcribe.resolve_output_paths(audio_path, job.get("output"), formats)
+
+    device = media_transcribe.pick_device(job.get("device", "auto"))
+    compute = job.get("compute_type") or media_transcribe.pick_compute_type(device)
+    model = _get_model(job.get("model", "large-v3"), device, compute, job.get("cpu_threads", 0))
+
+    segments_iter, info = model.transcribe(str(audio_path), vad_filter=job.get("vad_filter", True))
+    num_segments = media_transcribe.write_outputs(segments_iter, info, formats, output_paths)
+
+    return {
+        "ok": True,
+        "outputs": {fmt: str(path) for fmt, path in output_paths.items()},
+        "language": info.language,
+        "language_probability": info.language_probability,
+        "num_segments": num_segments,
+    }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            reply = _run_job(json.loads(line))
+        except Exception as e:  # de server mag niet sneuvelen op één kapotte job
+            reply = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def _spawn(socket_path: Path) -> None:
+    subprocess.Popen(
+        [sys.executable, __file__, "--socket", str(socket_path)],
+        start_new_session=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def request(job: dict, socket_path: Path = DEFAULT_SOCKET, spawn: bool = True, timeout: float = 30.0) -> dict:
+    """Stuur een job naar de server; start die zo nodig en wacht tot hij luistert."""
+    deadline = time.monotonic() + timeout
+    spawned = False
+    while True:
+        try:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.connect(str(socket_path))
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not spawn:
+                raise
+            if not spawned:
+                _spawn(socket_path)
+                spawned = True
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+    with conn:
+        conn.sendall(json.dumps(job).encode("utf-8") + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lang-levende transcriptie-server")
+    parser.add_argument("--socket", default=str(DEFAULT_SOCKET), help="Pad van de Unix socket")
+    args = parser.parse_args()
+
+    socket_path = Path(args.socket)
+    if socket_path.exists():
+        # Opruimen van een stale socket van een eerdere run.
+        try:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            probe.connect(str(socket_path))
+            probe.close()
+            print(f"Er luistert al een server op {socket_path}")
+            return 1
+        except (ConnectionRefusedError, FileNotFoundError):
+            socket_path.unlink(missing_ok=True)
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    with socketserver.UnixStreamServer(str(socket_path), _Handler) as server:
+        print(f"Transcriptie-server luistert op {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_path.unlink(missing_ok=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,66 +5,182 @@
 #   ./ocr_epub_inject.py book.html langs [--mode inject|replace] [--root PATH] [--out PATH] [--inplace] [--no-css-url]
 #
 # Dependencies:
-#   python3, tesseract, beautifulsoup4
-#   optional: lxml, rsvg-convert or ImageMagick convert (for SVG)
-import argparse, hashlib, os, re, sys, subprocess
+#   python3, tesseract, lxml
+#   optional: rsvg-convert or ImageMagick convert (for SVG)
+import argparse, functools, hashlib, mmap, os, re, sys, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from bs4 import BeautifulSoup
+# Direct lxml i.p.v. BeautifulSoup: parseren, muteren en serialiseren lopen
+# dan volledig op C-niveau, en juist het terugschrijven van een book.html van
+# enkele MB domineerde de niet-OCR-tijd.
+from lxml import etree
+from lxml import html as lxml_html
 
-# parser-keuze: lxml als aanwezig, anders builtin
-try:
-    import lxml  # noqa
-    PARSER = "lxml"
-except Exception:
-    PARSER = "html.parser"
-
-IMG_EXTS = {".png",".jpg",".jpeg",".tif",".tiff",".gif",".jp2",".webp",".bmp",".pbm",".pgm",".ppm",".svg"}
+IMG_EXTS = frozenset({".png",".jpg",".jpeg",".tif",".tiff",".gif",".jp2",".webp",".bmp",".pbm",".pgm",".ppm",".svg"})
 URL_RE = re.compile(r"url\(\s*['\"]?([^'\"\)]+)['\"]?\s*\)", re.I)
 
-def run(cmd):
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+def run(cmd, env=None):
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
     if p.returncode != 0:
         raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{p.stderr}")
     return p
 
-def ensure_css(soup: BeautifulSoup):
-    head = soup.find("head")
-    if not head:
-        if not soup.html:
-            html = soup.new_tag("html"); soup.append(html)
-            head = soup.new_tag("head"); html.append(head)
-            body = soup.new_tag("body"); html.append(body)
-        else:
-            head = soup.new_tag("head"); soup.html.insert(0, head)
-    if not soup.find("meta", attrs={"charset": True}):
-        head.append(soup.new_tag("meta", charset="utf-8"))
-    if not soup.find("style", attrs={"id": "ocr-css"}):
-        style = soup.new_tag("style", id="ocr-css")
-        style.string = ".ocr-text{white-space:pre-wrap;font-family:serif;border-left:3px solid #ccc;padding-left:.6em;margin:.6em 0;}"
-        head.append(style)
+# Tesseract single-threaded houden: wij parallelliseren zelf over afbeeldingen,
+# en N processen x M OpenMP-threads oversubscribed de CPU alleen maar.
+_TESS_ENV = {**os.environ, "OMP_THREAD_LIMIT": "1"}
+
+# Optioneel: tesserocr houdt de engine (met geladen taaldata) in-process in
+# leven, i.p.v. ~100-500ms engine-init per tesseract-subprocess.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+_tls = threading.local()
+
+def _tess_api(langs: str):
+    """Per-thread persistente PyTessBaseAPI (de API is niet thread-safe)."""
+    api = getattr(_tls, "api", None)
+    if api is None or _tls.langs != langs:
+        if api is not None:
+            api.End()
+        api = tesserocr.PyTessBaseAPI(
+            lang=langs, oem=tesserocr.OEM.LSTM_ONLY, psm=tesserocr.PSM.AUTO)
+        _tls.api, _tls.langs = api, langs
+    return api
+
+def ensure_css(doc):
+    # document_fromstring garandeert een <html>-root; alleen <head> kan ontbreken
+    head = doc.find("head")
+    if head is None:
+        head = etree.Element("head")
+        doc.insert(0, head)
+    if not doc.xpath("//meta[@charset]"):
+        etree.SubElement(head, "meta", charset="utf-8")
+    if not head.xpath("style[@id='ocr-css']"):
+        style = etree.SubElement(head, "style", id="ocr-css")
+        style.text = ".ocr-text{white-space:pre-wrap;font-family:serif;border-left:3px solid #ccc;padding-left:.6em;margin:.6em 0;}"
+
+# cache-keying hoeft niet cryptografisch: xxhash is ~4x sneller op grote
+# scans; zonder xxhash valt het terug op sha1
+try:
+    from xxhash import xxh64 as _new_hash
+except ImportError:
+    _new_hash = hashlib.sha1
+
+def _cache_key(img_path: Path, langs: str) -> str:
+    h = _new_hash()
+    h.update(langs.encode())
+    size = img_path.stat().st_size
+    if size >= 10 * 1024 * 1024:
+        # grote bestanden via mmap hashen i.p.v. eerst volledig inlezen
+        with open(img_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            h.update(mm)
+    else:
+        h.update(img_path.read_bytes())
+    return h.hexdigest()
+
+def _cache_write(dest: Path, text: str) -> None:
+    """Schrijf atomisch (tmp + rename): workers die cache_dir delen zien
+    nooit een half bestand, en een crash laat geen corrupte cache achter."""
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(text.encode("utf-8"))
+    os.replace(tmp, dest)
+
+def ocr_cache_lookup(img_path: Path, langs: str, cache_dir: Path):
+    """Geef (cache-key, tekst of None) terug zonder tesseract te starten."""
+    h = _cache_key(img_path, langs)
+    cached = cache_dir / f"{h}.bin"
+    if cached.exists():
+        # binair lezen en één keer decoderen, i.p.v. de tekstlaag erbij
+        return h, cached.read_bytes().decode("utf-8", "ignore")
+    return h, None
+
+def ocr_batch(items, langs: str, cache_dir: Path) -> dict:
+    """OCR meerdere afbeeldingen (pad, cache-key) in één tesseract-run.
+
+    Eén engine-init i.p.v. één per afbeelding: tesseract leest de filelist en
+    plakt de uitvoer aaneen met form-feeds, die we terugsplitsen per pad.
+    SVG's horen hier niet thuis (die hebben eerst rasterisatie nodig).
+    """
+    results = {}
+    if not items:
+        return results
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    filelist = cache_dir / "batch.txt"
+    filelist.write_text("\n".join(str(p) for p, _ in items) + "\n", encoding="utf-8")
+    out_base = cache_dir / "batch_out"
+    out_txt = cache_dir / "batch_out.txt"
+    try:
+        run(["tesseract", str(filelist), str(out_base), "-l", langs, "--oem","1","--psm","3","txt"], env=_TESS_ENV)
+        chunks = out_txt.read_text(encoding="utf-8", errors="ignore").split("\f")
+        for (p, h), text in zip(items, chunks):
+            _cache_write(cache_dir / f"{h}.bin", text)
+            results[p] = text
+    finally:
+        filelist.unlink(missing_ok=True)
+        out_txt.unlink(missing_ok=True)
+    return results
+
+def _rasterize_svg(svg_path: Path, png_path: Path) -> Path:
+    """Rasteriseer een SVG naar PNG op 300dpi (rsvg-convert, anders ImageMagick)."""
+    try:
+        run(["rsvg-convert", str(svg_path), "--dpi-x=300", "--dpi-y=300", "-o", str(png_path)])
+    except Exception:
+        run(["convert", str(svg_path), "-density","300","-units","PixelsPerInch","-resample","300x300", str(png_path)])
+    return png_path
+
+def _ocr_svg_piped(img_path: Path, out_base: Path, langs: str) -> None:
+    """Pijp rsvg-convert PNG-uitvoer direct in tesseract-stdin (geen temp-PNG)."""
+    p1 = subprocess.Popen(
+        ["rsvg-convert", str(img_path), "--dpi-x=300", "--dpi-y=300"],
+        stdout=subprocess.PIPE)
+    p2 = subprocess.Popen(
+        ["tesseract", "stdin", str(out_base), "-l", langs, "--oem","1","--psm","3","txt"],
+        stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_TESS_ENV)
+    p1.stdout.close()
+    _, err = p2.communicate()
+    p1.wait()
+    if p1.returncode != 0 or p2.returncode != 0:
+        raise RuntimeError(f"SVG OCR pipeline failed: {img_path}\n{err.decode(errors='ignore')}")
+
+@functools.lru_cache(maxsize=4096)
+def _ocr_image_cached(path_str: str, langs: str, cache_dir_str: str) -> str:
+    return _ocr_image_uncached(Path(path_str), langs, Path(cache_dir_str))
 
 def ocr_image(img_path: Path, langs: str, cache_dir: Path) -> str:
+    # In-memory memoisatie bovenop de disk-cache: herhaalde verwijzingen naar
+    # dezelfde afbeelding slaan ook het hashen en het .txt-lezen over.
+    return _ocr_image_cached(str(img_path), langs, str(cache_dir))
+
+def _ocr_image_uncached(img_path: Path, langs: str, cache_dir: Path) -> str:
     cache_dir.mkdir(parents=True, exist_ok=True)
-    h = hashlib.sha1(img_path.read_bytes() + langs.encode()).hexdigest()
-    txt = cache_dir / f"{h}.txt"
-    if txt.exists():
-        return txt.read_text(encoding="utf-8", errors="ignore")
+    h, cached = ocr_cache_lookup(img_path, langs, cache_dir)
+    if cached is not None:
+        return cached
+
+    if tesserocr is not None and img_path.suffix.lower() != ".svg":
+        api = _tess_api(langs)
+        api.SetImageFile(str(img_path))
+        text = api.GetUTF8Text()
+        _cache_write(cache_dir / f"{h}.bin", text)
+        return text
 
-    src = img_path
+    out_base = cache_dir / f"{h}_out"
     tmp_png = None
     if img_path.suffix.lower() == ".svg":
-        tmp_png = cache_dir / f"{h}.png"
         try:
-            run(["rsvg-convert", str(img_path), "-o", str(tmp_png), "--dpi-x=300", "--dpi-y=300"])
+            _ocr_svg_piped(img_path, out_base, langs)
         except Exception:
+            # geen rsvg-convert (of pipe mislukt): ImageMagick via temp-PNG
+            tmp_png = cache_dir / f"{h}.png"
             run(["convert", str(img_path), "-density","300","-units","PixelsPerInch","-resample","300x300", str(tmp_png)])
-        src = tmp_png
-
-    out_base = cache_dir / f"{h}_out"
-    run(["tesseract", str(src), str(out_base), "-l", langs, "--oem","1","--psm","3","txt"])
+            run(["tesseract", str(tmp_png), str(out_base), "-l", langs, "--oem","1","--psm","3","txt"], env=_TESS_ENV)
+    else:
+        run(["tesseract", str(img_path), str(out_base), "-l", langs, "--oem","1","--psm","3","txt"], env=_TESS_ENV)
     out_txt = cache_dir / f"{h}_out.txt"
-    text = out_txt.read_text(encoding="utf-8", errors="ignore")
-    txt.write_text(text, encoding="utf-8")
+    text = out_txt.read_bytes().decode("utf-8", "ignore")
+    _cache_write(cache_dir / f"{h}.bin", text)
 
     try:
         out_txt.unlink()
@@ -75,45 +191,59 @@ def ocr_image(img_path: Path, langs: str, cache_dir: Path) -> str:
         pass
     return text
 
+@functools.lru_cache(maxsize=8)
+def _build_name_index(root: Path) -> dict:
+    """Bestandsnaam -> pad voor de hele boom onder root (eerste treffer wint).
+
+    os.scandir gebruikt het d_type-veld uit getdents64 en spaart zo een
+    stat() per entry uit; dat is ruim sneller dan rglob, dat bovendien een
+    Path-object per entry aanmaakt.
+    """
+    index = {}
+    stack = [str(root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    index.setdefault(entry.name, Path(entry.path))
+    return index
+
 def find_resource(src: str, html_path: Path, root: Path) -> Path | None:
-    # probeer: naast HTML, relatief t.o.v. root, en als laatste: glob op bestandsnaam
+    # probeer: naast HTML, relatief t.o.v. root, en als laatste: de naam-index
+    # (één scandir-walk over de hele boom i.p.v. één rglob per ontbrekend pad)
     cand = (html_path.parent / src)
     if cand.exists():
         return cand
     cand2 = (root / src.lstrip("/"))
     if cand2.exists():
         return cand2
-    name = Path(src).name
-    for p in root.rglob(name):
-        if p.is_file():
-            return p
-    return None
+    return _build_name_index(root).get(Path(src).name)
 
 def inject_into_book(book_html: Path, langs: str, mode: str, root: Path, cache_dir: Path, include_css_urls=True) -> int:
-    html = book_html.read_text(encoding="utf-8", errors="ignore")
-    soup = BeautifulSoup(html, PARSER)
-    ensure_css(soup)
+    doc = lxml_html.document_fromstring(book_html.read_bytes())
+    ensure_css(doc)
 
     targets = []  # (tag, src_str, resolved_path)
     # img / object / embed
-    for tag in soup.find_all(["img","object","embed"]):
-        attr = None
-        if tag.name == "img":
-            attr = tag.get("src")
-        elif tag.name == "object":
-            attr = tag.get("data")
-        else:
-            attr = tag.get("src")
+    for tag in doc.xpath("//img|//object|//embed"):
+        attr = tag.get("data") if tag.tag == "object" else tag.get("src")
         if not attr:
             continue
-        res = find_resource(attr.strip(), book_html, root)
+        src = attr.strip()
+        res = find_resource(src, book_html, root)
         if not res or res.suffix.lower() not in IMG_EXTS:
             continue
-        targets.append((tag, attr.strip(), res))
+        targets.append((tag, src, res))
 
     # inline CSS background-image: url(...)
     if include_css_urls:
-        for tag in soup.find_all(style=True):
+        for tag in doc.xpath("//*[@style]"):
             style = tag.get("style","")
             for m in URL_RE.finditer(style):
                 url = m.group(1)
@@ -122,23 +252,89 @@ def inject_into_book(book_html: Path, langs: str, mode: str, root: Path, cache_d
                     continue
                 targets.append((tag, url, res))
 
-    changed = 0
-    for tag, src_str, path in targets:
+    # Cache-hits eerst oplossen; de rest gaat in één tesseract-batchrun.
+    # SVG's worden eerst parallel gerasteriseerd en gaan daarna als PNG mee;
+    # een eventueel mislukte batch valt terug op losse runs, parallel via
+    # threads (subprocess geeft de GIL vrij).
+    unique_paths = list(dict.fromkeys(path for _, _, path in targets))
+    results = {}
+    batch_items = []
+    per_file = []
+    svg_misses = []
+    for p in unique_paths:
         try:
-            text = ocr_image(path, langs, cache_dir)
+            h, cached = ocr_cache_lookup(p, langs, cache_dir)
         except Exception:
             continue
+        if cached is not None:
+            results[p] = cached
+        elif p.suffix.lower() == ".svg":
+            svg_misses.append((p, h))
+        elif tesserocr is not None:
+            # in-process engine: persistente API per thread parallelliseert
+            # beter dan één seriële batch-subprocess
+            per_file.append(p)
+        else:
+            batch_items.append((p, h))
+
+    # Rasterisatie is onafhankelijk van tesseract: alle SVG's tegelijk naar
+    # PNG, zodat de OCR daarna over een homogene rasterlijst loopt.
+    raster = {}  # png-pad -> (svg-pad, cache-key van de svg)
+    if svg_misses:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        workers = min(len(svg_misses), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(_rasterize_svg, p, cache_dir / f"{h}.png"): (p, h)
+                       for p, h in svg_misses}
+            for fut in as_completed(futures):
+                p, h = futures[fut]
+                try:
+                    raster[fut.result()] = (p, h)
+                except Exception:
+                    per_file.append(p)  # gepijpte route per bestand als fallback
+        if tesserocr is not None:
+            per_file.extend(raster)
+        else:
+            batch_items.extend((png, h) for png, (_, h) in raster.items())
+    try:
+        results.update(ocr_batch(batch_items, langs, cache_dir))
+    except Exception:
+        per_file.extend(p for p, _ in batch_items)
+    if per_file:
+        workers = min(len(per_file), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(ocr_image, p, langs, cache_dir): p for p in per_file}
+            for fut in as_completed(futures):
+                try:
+                    results[futures[fut]] = fut.result()
+                except Exception:
+                    pass  # mislukte OCR: tag onaangeroerd laten, zoals voorheen
+
+    # Resultaten van gerasteriseerde PNG's terugboeken op hun SVG, en de
+    # cache onder de SVG-sleutel vullen zodat de volgende run direct raakt.
+    for png, (p, h) in raster.items():
+        text = results.pop(png, None)
+        if text is not None:
+            results[p] = text
+            _cache_write(cache_dir / f"{h}.bin", text)
+        png.unlink(missing_ok=True)
+
+    changed = 0
+    for tag, src_str, path in targets:
+        text = results.get(path)
+        if text is None:
+            continue
 
-        ocr_div = soup.new_tag("div", attrs={"class":"ocr-text","data-src":src_str})
-        ocr_div.string = text or ""
-        if mode == "replace" and tag.name in ("img","object","embed"):
-            tag.replace_with(ocr_div)
+        ocr_div = etree.Element("div", attrib={"class": "ocr-text", "data-src": src_str})
+        ocr_div.text = text or ""
+        if mode == "replace" and tag.tag in ("img","object","embed"):
+            ocr_div.tail = tag.tail
+            tag.getparent().replace(tag, ocr_div)
         else:
-            tag.insert_after(ocr_div)
+            tag.addnext(ocr_div)
         changed += 1
 
-    book_html_out = book_html
-    return changed, soup
+    return changed, doc
 
 def main():
     ap = argparse.ArgumentParser(description="Injecteer OCR-tekst in book.html")
@@ -158,7 +354,7 @@ def main():
     root = Path(args.root).resolve() if args.root else book_html.parent
     cache_dir = (root / ".ocr_cache")
 
-    changed, soup = inject_into_book(
+    changed, doc = inject_into_book(
         book_html, args.langs, args.mode, root, cache_dir,
         include_css_urls=not args.no_css_url
     )
@@ -168,7 +364,7 @@ def main():
     else:
         out_path = book_html.with_name(book_html.stem + "_ocr" + book_html.suffix)
 
-    out_path.write_text(str(soup), encoding="utf-8")
+    out_path.write_bytes(etree.tostring(doc.getroottree(), encoding="utf-8", method="html"))
     print(f"OCR-injecties: {changed}")
     print(f"Geschreven: {out_path}")
 
@@ -12,249 +12,374 @@ Strategy:
 """
 
 import fitz
+import io
+import mmap
+import numpy as np
 import os
+import re
 import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from dataclasses import dataclass
-from typing import List, Dict, Tuple
-from collections import defaultdict
 
+# Optional: numba compiles the remaining per-span loop in mark_underlines to
+# machine code; without it the NumPy sweep below is used.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
-@dataclass
-class Span:
-    """A text span with position and styling."""
-    text: str
-    x: float
-    y: float
-    width: float
-    height: float
-    is_bold: bool
-    is_italic: bool
-    is_underlined: bool = False
+# Cache keys need speed, not cryptography: xxhash if available, sha1 otherwise.
+try:
+    from xxhash import xxh64 as _new_hash
+except ImportError:
+    from hashlib import sha1 as _new_hash
 
 
-def escape_typst(text):
-    """Escape special Typst characters."""
-    if not text:
-        return ""
-    text = text.replace('\\', '\\\\')
-    text = text.replace('#', '\\#')
-    text = text.replace('*', '\\*')
-    text = text.replace('_', '\\_')
-    text = text.replace('[', '\\[')
-    text = text.replace(']', '\\]')
-    text = text.replace('<', '\\<')
-    text = text.replace('>', '\\>')
-    text = text.replace('`', '\\`')
-    text = text.replace('$', '\\$')
-    text = text.replace('@', '\\@')
-    return text
+# Spans as a structure-of-arrays: text stays a Python list, the geometry and
+# style flags are parallel NumPy arrays so clustering/assignment can be
+# vectorized instead of touching one object per span.
+SpanArr = namedtuple('SpanArr', 'text x y w h bold italic under')
 
 
-def extract_all_spans(page):
-    """Extract all text spans with positions and styling."""
-    blocks_dict = page.get_text("dict")
-    spans = []
+def _empty_spans():
+    zf = np.empty(0, np.float32)
+    zb = np.zeros(0, np.bool_)
+    return SpanArr([], zf, zf.copy(), zf.copy(), zf.copy(), zb, zb.copy(), zb.copy())
 
-    for block in blocks_dict['blocks']:
-        if block['type'] != 0:
-            continue
 
-        for line in block['lines']:
-            for span_data in line['spans']:
-                text = span_data['text']
-                if not text or text.isspace():
-                    continue
-
-                bbox = span_data['bbox']
-                span = Span(
-                    text=text,
-                    x=bbox[0],
-                    y=bbox[1],
-                    width=bbox[2] - bbox[0],
-                    height=bbox[3] - bbox[1],
-                    is_bold=(span_data['flags'] & 2**4) > 0,
-                    is_italic=(span_data['flags'] & 2**1) > 0
-                )
-                spans.append(span)
+# One pass over the string instead of ten sequential str.replace calls, each
+# of which re-scans and reallocates the whole string.
+_ESCAPE_RE = re.compile(r'([\\#*_\[\]<>`$@])')
 
-    return spans
 
+def escape_typst(text):
+    """Escape special Typst characters."""
+    return _ESCAPE_RE.sub(r'\\\1', text) if text else ""
 
-def extract_underlines(page):
-    """Extract underline positions."""
-    underlines = []
-    drawings = page.get_drawings()
 
-    for drawing in drawings:
-        if drawing['type'] == 'f':
-            rect = drawing['rect']
-            if rect.height < 5:
-                underlines.append({
-                    'y': (rect.y0 + rect.y1) / 2,
-                    'x0': rect.x0,
-                    'x1': rect.x1
-                })
+# Image blocks get filtered out below anyway; telling MuPDF up front not to
+# decode and base64-wrap them avoids building those dict entries at all.
+_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
 
-    return underlines
 
+def extract_all_spans(page):
+    """Extract all text spans as parallel arrays (SoA)."""
+    recs = [
+        (s['text'], b[0], b[1], b[2] - b[0], b[3] - b[1],
+         (s['flags'] & 2**4) > 0, (s['flags'] & 2**1) > 0)
+        for block in page.get_text("dict", flags=_TEXT_FLAGS)['blocks'] if block['type'] == 0
+        for line in block['lines']
+        for s in line['spans']
+        if s['text'] and not s['text'].isspace()
+        for b in (s['bbox'],)
+    ]
+    if not recs:
+        return _empty_spans()
+
+    text, x, y, w, h, bold, italic = zip(*recs)
+    return SpanArr(
+        list(text),
+        np.asarray(x, np.float32), np.asarray(y, np.float32),
+        np.asarray(w, np.float32), np.asarray(h, np.float32),
+        np.asarray(bold, np.bool_), np.asarray(italic, np.bool_),
+        np.zeros(len(text), np.bool_),
+    )
 
-def mark_underlines(spans, underlines):
-    """Mark which spans have underlines."""
-    for span in spans:
-        y_bottom = span.y + span.height
-
-        for ul in underlines:
-            # Check if underline is near this span (y-wise and x-wise)
-            if abs(ul['y'] - y_bottom) <= 5:
-                # Check x-overlap
-                span_x_end = span.x + span.width
-                if not (ul['x1'] < span.x or ul['x0'] > span_x_end):
-                    span.is_underlined = True
+
+def extract_underlines(page):
+    """Extract underline positions (thin filled rects)."""
+    return [
+        {'y': (r.y0 + r.y1) / 2, 'x0': r.x0, 'x1': r.x1}
+        for d in page.get_drawings()
+        if d['type'] == 'f'
+        for r in (d['rect'],)
+        if r.height < 5
+    ]
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _mark_underlines_nb(x, y, w, h, ul_y, ul_x0, ul_x1):
+        n = x.shape[0]
+        m = ul_y.shape[0]
+        out = np.zeros(n, np.bool_)
+        for i in range(n):
+            yb = y[i] + h[i]
+            xe = x[i] + w[i]
+            lo = np.searchsorted(ul_y, yb - 5)
+            for j in range(lo, m):
+                if ul_y[j] > yb + 5:
+                    break
+                if ul_x1[j] >= x[i] and ul_x0[j] <= xe:
+                    out[i] = True
                     break
+        return out
 
 
-def cluster_positions(positions, tolerance=5):
-    """Cluster close positions together."""
-    if not positions:
-        return []
+def mark_underlines(spans, underlines):
+    """Mark which spans have underlines (sets spans.under in place)."""
+    if not underlines or not spans.text:
+        return
+
+    # Sorteer de underlines op y; searchsorted levert per span alleen de
+    # kandidaten binnen +-5pt op, i.p.v. alle M underlines per span te testen.
+    ul_y = np.array([u['y'] for u in underlines], np.float32)
+    ul_x0 = np.array([u['x0'] for u in underlines], np.float32)
+    ul_x1 = np.array([u['x1'] for u in underlines], np.float32)
+    order = np.argsort(ul_y)
+    ul_y, ul_x0, ul_x1 = ul_y[order], ul_x0[order], ul_x1[order]
+
+    if njit is not None:
+        spans.under[:] = _mark_underlines_nb(
+            spans.x, spans.y, spans.w, spans.h, ul_y, ul_x0, ul_x1)
+        return
+
+    y_bottom = spans.y + spans.h
+    x_end = spans.x + spans.w
+    lo = np.searchsorted(ul_y, y_bottom - 5, side='left')
+    hi = np.searchsorted(ul_y, y_bottom + 5, side='right')
+
+    x, under = spans.x, spans.under
+    for i in range(len(under)):
+        l, r = lo[i], hi[i]
+        if l < r and np.any((ul_x1[l:r] >= x[i]) & (ul_x0[l:r] <= x_end[i])):
+            under[i] = True
 
-    sorted_pos = sorted(set(positions))
-    clusters = [[sorted_pos[0]]]
 
-    for pos in sorted_pos[1:]:
-        if pos - clusters[-1][-1] <= tolerance:
-            clusters[-1].append(pos)
-        else:
-            clusters.append([pos])
+def cluster_positions(positions, tolerance=5):
+    """Cluster close positions together; returns the sorted cluster means."""
+    a = np.unique(np.asarray(positions, dtype=np.float32))
+    if a.size == 0:
+        return np.empty(0, np.float32)
 
-    # Return average of each cluster
-    return [sum(cluster) / len(cluster) for cluster in clusters]
+    # Breekpunten waar de sprong groter is dan de tolerantie; cumsum geeft
+    # per positie het cluster-id, bincount de som/telling per cluster.
+    ids = np.concatenate(([0], np.cumsum(np.diff(a) > tolerance)))
+    sums = np.bincount(ids, weights=a)
+    counts = np.bincount(ids)
+    return (sums / counts).astype(np.float32)
 
 
-def assign_to_cluster(value, clusters, tolerance=5):
-    """Find which cluster a value belongs to."""
-    for i, cluster_center in enumerate(clusters):
-        if abs(value - cluster_center) <= tolerance:
-            return i
-    # Shouldn't happen, but fallback
-    return 0
+def assign_bulk(values, clusters):
+    """Nearest-cluster index for all values at once (clusters are sorted)."""
+    idx = np.searchsorted(clusters, values)
+    idx = np.clip(idx, 0, len(clusters) - 1)
+    left = np.maximum(idx - 1, 0)
+    use_left = np.abs(values - clusters[left]) < np.abs(values - clusters[idx])
+    return np.where(use_left, left, idx)
 
 
-def format_span(span):
-    """Format a single span with its styling."""
-    text = escape_typst(span.text)
+def format_span(spans, i):
+    """Format span i with its styling."""
+    text = escape_typst(spans.text[i])
 
-    if span.is_bold and span.is_underlined:
+    if spans.bold[i] and spans.under[i]:
         return f"#underline[#strong[{text}]]"
-    elif span.is_bold:
+    elif spans.bold[i]:
         return f"#strong[{text}]"
-    elif span.is_italic:
+    elif spans.italic[i]:
         return f"#emph[{text}]"
-    elif span.is_underlined:
+    elif spans.under[i]:
         return f"#underline[{text}]"
     else:
         return text
 
 
-def generate_typst_from_pdf(pdf_path, output_path=None):
-    """Generate Typst using global grid approach."""
-    doc = fitz.open(pdf_path)
-    typst_lines = []
+# Extraction results are cached on disk, keyed by the PDF's content hash:
+# re-running during iterative Typst tuning skips PyMuPDF entirely.
+def _pdf_cache_key(pdf_path):
+    h = _new_hash()
+    with open(pdf_path, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        except (ValueError, OSError):
+            h.update(f.read())
+    return h.hexdigest()
 
-    # Header
-    typst_lines.append("// Generated from PDF using global grid approach")
-    typst_lines.append("")
-    typst_lines.append("#set page(paper: \"a4\", margin: (x: 2cm, y: 2cm))")
-    font = os.environ.get("TYPST_FONT", "Calibri")
-    typst_lines.append(f"#set text(font: \"{font}\", size: 11pt)")
-    typst_lines.append("#set par(leading: 0.65em)")
-    typst_lines.append("")
 
-    for page_idx, page in enumerate(doc):
-        if page_idx > 0:
-            typst_lines.append("#pagebreak()")
-            typst_lines.append("")
+def _cache_base():
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "pdf_to_typst"
 
-        # Extract all content
-        spans = extract_all_spans(page)
-        underlines = extract_underlines(page)
-        mark_underlines(spans, underlines)
 
-        if not spans:
-            continue
+def _load_page_cache(cache_file):
+    try:
+        d = np.load(cache_file, allow_pickle=True)
+        return SpanArr(list(d['text']), d['x'], d['y'], d['w'], d['h'],
+                       d['bold'], d['italic'], d['under'])
+    except Exception:
+        return None
 
-        # Collect all x and y positions
-        x_positions = [span.x for span in spans]
-        y_positions = [span.y for span in spans]
 
-        # Cluster into columns and rows
-        x_clusters = cluster_positions(x_positions, tolerance=5)
-        y_clusters = cluster_positions(y_positions, tolerance=3)
+def _save_page_cache(cache_file, spans):
+    # Atomic (tmp + rename) so parallel workers never leave a torn file;
+    # a failed cache write must never break the conversion itself.
+    try:
+        tmp = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(
+                f, text=np.array(spans.text, dtype=object),
+                x=spans.x, y=spans.y, w=spans.w, h=spans.h,
+                bold=spans.bold, italic=spans.italic, under=spans.under)
+        os.replace(tmp, cache_file)
+    except Exception:
+        pass
+
+
+# Each worker keeps its own document open across the pages it handles;
+# fitz documents cannot be pickled, so workers reopen by path.
+_worker_doc = (None, None)
+
+
+def _extract_page_spans(pdf_path, page_idx):
+    global _worker_doc
+    if _worker_doc[0] != pdf_path:
+        _worker_doc = (pdf_path, fitz.open(pdf_path))
+    page = _worker_doc[1][page_idx]
+
+    spans = extract_all_spans(page)
+    underlines = extract_underlines(page)
+    mark_underlines(spans, underlines)
+    return spans
+
 
-        print(f"Page {page_idx + 1}:")
-        print(f"  Found {len(x_clusters)} columns at x={[f'{x:.0f}' for x in x_clusters]}")
-        print(f"  Found {len(y_clusters)} rows")
+def _cell_content(spans, cell):
+    """Format one cell's spans, turning a leading bullet glyph into '- '."""
+    text = ''.join(spans.text[i] for i in cell)
+    if text.strip().startswith('•'):
+        formatted_spans = []
+        for pos, i in enumerate(cell):
+            if pos == 0 and spans.text[i].strip() in ['•', '●', '◦']:
+                continue
+            formatted_spans.append(format_span(spans, i))
+        return f"- {''.join(formatted_spans)}"
+    return ''.join(format_span(spans, i) for i in cell)
+
+
+def _process_page(pdf_path, cache_dir, page_idx):
+    """Render one page to Typst; returns (snippet, stats text or None)."""
+    spans = None
+    cache_file = cache_dir / f"page{page_idx}.npz" if cache_dir else None
+    if cache_file is not None and cache_file.exists():
+        spans = _load_page_cache(cache_file)
+    if spans is None:
+        spans = _extract_page_spans(pdf_path, page_idx)
+        if cache_file is not None:
+            _save_page_cache(cache_file, spans)
+
+    n_spans = len(spans.text)
+    if not n_spans:
+        return "", None
+
+    # Cluster into columns and rows
+    x_clusters = cluster_positions(spans.x, tolerance=5)
+    y_clusters = cluster_positions(spans.y, tolerance=3)
+
+    stats = (f"Page {page_idx + 1}:\n"
+             f"  Found {len(x_clusters)} columns at x={[f'{x:.0f}' for x in x_clusters]}\n"
+             f"  Found {len(y_clusters)} rows")
+
+    # Create grid: grid[row_idx][col_idx] = [span indices]
+    grid = [[[] for _ in x_clusters] for _ in y_clusters]
+
+    # Assign all spans to cells in two vectorized passes
+    row_ids = assign_bulk(spans.y, y_clusters)
+    col_ids = assign_bulk(spans.x, x_clusters)
+    for i in range(n_spans):
+        grid[row_ids[i]][col_ids[i]].append(i)
+
+    # Sort spans within each cell by x position
+    span_x = spans.x
+    for row in grid:
+        for cell in row:
+            cell.sort(key=lambda i: span_x[i])
+
+    out = io.StringIO()
+    w = out.write
+
+    # Generate Typst for each row
+    for row_idx, row in enumerate(grid):
+        # Check if row has any content
+        filled_cols = sum(1 for cell in row if cell)
+
+        if filled_cols == 0:
+            continue
 
-        # Create grid: grid[row_idx][col_idx] = [list of spans]
-        grid = [[[] for _ in x_clusters] for _ in y_clusters]
+        # A row whose only content sits in the first column doesn't need the
+        # grid machinery: a plain paragraph compiles faster and reads better.
+        # Keep the grid whenever horizontal placement actually matters.
+        if filled_cols == 1 and row[0]:
+            w(_cell_content(spans, row[0]))
+            w("\n\n")
+            continue
 
-        # Assign each span to a cell
-        for span in spans:
-            row_idx = assign_to_cluster(span.y, y_clusters, tolerance=3)
-            col_idx = assign_to_cluster(span.x, x_clusters, tolerance=5)
-            grid[row_idx][col_idx].append(span)
+        w("#grid(\n")
+        w(f"  columns: {len(x_clusters)},\n")
+        w("  gutter: 1em,\n")
 
-        # Sort spans within each cell by x position
-        for row in grid:
-            for cell in row:
-                cell.sort(key=lambda s: s.x)
+        for col_idx, cell in enumerate(row):
+            if cell:
+                w(f"  [{_cell_content(spans, cell)}],\n")
+            else:
+                w("  [],\n")
 
-        # Generate Typst for each row
-        for row_idx, row in enumerate(grid):
-            # Check if row has any content
-            filled_cols = sum(1 for cell in row if cell)
+        w(")\n")
 
-            if filled_cols == 0:
-                continue
+    w("\n")
+    return out.getvalue(), stats
 
-            # ALWAYS use grid - even for single column
-            typst_lines.append("#grid(")
-            typst_lines.append(f"  columns: {len(x_clusters)},")
-            typst_lines.append("  gutter: 1em,")
-
-            for col_idx, cell in enumerate(row):
-                if cell:
-                    # Check if starts with bullet
-                    text = ''.join(s.text for s in cell)
-                    if text.strip().startswith('•'):
-                        # Remove bullet symbol
-                        formatted_spans = []
-                        for i, span in enumerate(cell):
-                            if i == 0 and span.text.strip() in ['•', '●', '◦']:
-                                continue
-                            formatted_spans.append(format_span(span))
-                        content = f"- {''.join(formatted_spans)}"
-                    else:
-                        content = ''.join(format_span(s) for s in cell)
-                    typst_lines.append(f"  [{content}],")
-                else:
-                    typst_lines.append("  [],")
-
-            typst_lines.append(")")
-
-        typst_lines.append("")
 
+def generate_typst_from_pdf(pdf_path, output_path=None):
+    """Generate Typst using global grid approach.
+
+    Streams directly to output_path (returns None); without a path the
+    result is built in a StringIO and returned as a string.
+    """
+    doc = fitz.open(pdf_path)
+    n_pages = doc.page_count
     doc.close()
 
-    # Write output
-    typst_content = '\n'.join(typst_lines)
+    # Stream per regel naar de uitvoer i.p.v. alles in een lijst verzamelen
+    # en aan het einde joinen: scheelt de helft van het piekgeheugen.
+    out = open(output_path, 'w', encoding='utf-8', buffering=1 << 20) if output_path else io.StringIO()
+    w = out.write
 
-    if output_path:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(typst_content)
+    # Header
+    w("// Generated from PDF using global grid approach\n")
+    w("\n")
+    w("#set page(paper: \"a4\", margin: (x: 2cm, y: 2cm))\n")
+    font = os.environ.get("TYPST_FONT", "Calibri")
+    w(f"#set text(font: \"{font}\", size: 11pt)\n")
+    w("#set par(leading: 0.65em)\n")
+    w("\n")
+
+    # Extractie-cache per PDF-inhoud; mislukt aanmaken => zonder cache verder.
+    try:
+        cache_dir = _cache_base() / _pdf_cache_key(pdf_path)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        cache_dir = None
+
+    # Pagina's zijn onafhankelijk: één proces per core, elk met een eigen
+    # geopend document; map levert de snippets in paginavolgorde terug.
+    if n_pages:
+        workers = min(os.cpu_count() or 1, n_pages)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for page_idx, (snippet, stats) in enumerate(
+                    ex.map(partial(_process_page, pdf_path, cache_dir), range(n_pages))):
+                if page_idx > 0:
+                    w("#pagebreak()\n")
+                    w("\n")
+                if stats:
+                    print(stats)
+                w(snippet)
 
-    return typst_content
+    if output_path:
+        out.close()
+        return None
+    return out.getvalue()
 
 
 def main():
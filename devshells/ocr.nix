@@ -10,6 +10,9 @@ pkgs.mkShell {
   packages =
     (with pkgs; [
       python3
+      python3Packages.lxml
+      python3Packages.xxhash
+      python3Packages.tesserocr
       tesseract
       ocrmypdf
       poppler-utils
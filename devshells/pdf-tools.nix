@@ -9,5 +9,8 @@ pkgs.mkShell {
     poppler_utils
     typst
     python3Packages.pymupdf
+    python3Packages.numpy
+    python3Packages.numba
+    python3Packages.xxhash
   ];
 }